@@ -2,26 +2,126 @@
 """
 Fixed Web Scraper for d2pbuyersguide.com
 Handles 404 errors and provides alternative approaches
+
+Requires: pip install -r requirements-scraper.txt
 """
 
+import asyncio
 import requests
-import time
-import json
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+import lxml.html
+from lxml.etree import ParserError
 import os
-from urllib.parse import urljoin, urlparse
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from urllib.parse import urldefrag, urljoin, urlparse
+from collections import Counter
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Optional
 import logging
 
+from rate_limit import MAX_CONCURRENT_REQUESTS, REQUESTS_PER_SECOND, RateLimiter
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Status-code histograms are keyed by int, so allow non-str keys
+_JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+# Common endpoint patterns to test when the site exposes no links
+_ENDPOINT_PATHS = (
+    '/',
+    '/index.html',
+    '/index.php',
+    '/home',
+    '/main',
+    '/products',
+    '/items',
+    '/guide',
+    '/buyers-guide',
+    '/d2p',
+    '/api',
+    '/api/products',
+    '/api/items',
+    '/search',
+    '/category',
+    '/categories',
+    '/filter',
+    '/list',
+    '/all',
+    '/page/1',
+    '/page1',
+    '/p/1',
+    '/1'
+)
+
+def _preview(response: requests.Response, limit: int) -> str:
+    """Decode only the head of the body; response.text would decode all of it"""
+    head = response.content[:limit * 4]
+    if not head:
+        return "Empty response"
+    try:
+        return head.decode(response.encoding or 'utf-8', errors='ignore')[:limit]
+    except LookupError:
+        return head.decode('utf-8', errors='ignore')[:limit]
+
+def _content_length(response: requests.Response) -> int:
+    """Body size from Content-Length, measuring the content only when it is absent"""
+    try:
+        return int(response.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return len(response.content)
+
+class _RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter that paces requests actually sent over the network"""
+    
+    def __init__(self, rate_limiter: RateLimiter, **kwargs):
+        self.rate_limiter = rate_limiter
+        super().__init__(**kwargs)
+    
+    def send(self, request, **kwargs):
+        # Cache hits are answered by CachedSession and never get here
+        self.rate_limiter.wait()
+        return super().send(request, **kwargs)
+
 class D2PBuyersGuideScraper:
     def __init__(self):
-        self.session = requests.Session()
+        # Cache responses on disk so repeated debugging runs skip the network;
+        # 404s are cached too so dead endpoints are not re-probed every run
+        self.session = requests_cache.CachedSession(
+            'd2p_cache',
+            backend='sqlite',
+            expire_after=timedelta(hours=1),
+            cache_control=True,
+            allowable_codes=(200, 301, 302, 404)
+        )
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Connection': 'keep-alive',
+            'Accept-Encoding': 'gzip, deflate'
         })
+        # Reuse pooled keep-alive connections across all probes to the same host;
+        # transient failures are retried on the same pool with backoff, and
+        # every request that reaches the network is paced by the rate limiter
+        self.rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
+        adapter = _RateLimitedAdapter(
+            self.rate_limiter,
+            pool_connections=4,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['GET', 'HEAD'],
+                # Hand back the last response so it is reported with its status code
+                raise_on_status=False
+            )
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         # Ignore SSL certificate issues
         self.session.verify = False
         # Suppress SSL warnings
@@ -42,140 +142,184 @@ class D2PBuyersGuideScraper:
                 response = self.session.get(test_url, timeout=10)
                 results[test_url] = {
                     'status_code': response.status_code,
-                    'content_length': len(response.content),
-                    'content_preview': response.text[:200] if response.text else "Empty response"
+                    'content_length': _content_length(response),
+                    'content_preview': _preview(response, 200)
                 }
-                logger.info(f"✓ {test_url}: {response.status_code}")
+                logger.info("✓ %s: %s", test_url, response.status_code)
+                # One working protocol is enough; skip the fallback
+                if response.status_code < 400:
+                    break
             except Exception as e:
                 results[test_url] = {'error': str(e)}
-                logger.error(f"✗ {test_url}: {e}")
+                logger.error("✗ %s: %s", test_url, e)
         
         return results
     
-    def find_working_endpoints(self, base_domain: str) -> List[str]:
-        """Try to find working endpoints on the site"""
-        working_endpoints = []
+    def _discover_endpoints(self, base_url: str) -> List[str]:
+        """Collect same-site links from the landing page (even a 404 page carries navigation)"""
+        try:
+            response = self.session.get(base_url, timeout=10)
+            tree = lxml.html.fromstring(response.content)
+        except (requests.exceptions.RequestException, ParserError) as e:
+            logger.debug("✗ Could not discover links on %s: %s", base_url, e)
+            return []
         
-        # Common endpoint patterns to test
-        endpoints_to_test = [
-            '/',
-            '/index.html',
-            '/index.php',
-            '/home',
-            '/main',
-            '/products',
-            '/items',
-            '/guide',
-            '/buyers-guide',
-            '/d2p',
-            '/api',
-            '/api/products',
-            '/api/items',
-            '/search',
-            '/category',
-            '/categories',
-            '/filter',
-            '/list',
-            '/all',
-            '/page/1',
-            '/page1',
-            '/p/1',
-            '/1'
-        ]
+        base_netloc = urlparse(base_url).netloc
+        endpoints = {}
+        for href in tree.xpath('//a/@href'):
+            url = urldefrag(urljoin(base_url, href.strip()))[0]
+            parsed = urlparse(url)
+            if parsed.scheme in ('http', 'https') and parsed.netloc == base_netloc:
+                endpoints[url] = None
         
+        return list(endpoints)
+    
+    def find_working_endpoints(self, base_domain: str) -> List[str]:
+        """Try to find working endpoints on the site"""
         base_url = f"https://{base_domain}"
+        found = {}
         
-        for endpoint in endpoints_to_test:
-            test_url = urljoin(base_url, endpoint)
-            try:
-                response = self.session.get(test_url, timeout=10)
+        # Probe the links the site actually advertises, capped at the size of the
+        # guess list so a link-heavy page doesn't balloon the probe count
+        test_urls = self._discover_endpoints(base_url)
+        if test_urls:
+            logger.info("Discovered %s linked endpoints on %s", len(test_urls), base_url)
+            test_urls = test_urls[:len(_ENDPOINT_PATHS)]
+        else:
+            test_urls = [urljoin(base_url, endpoint) for endpoint in _ENDPOINT_PATHS]
+        
+        # Probes are independent; overlap them on the shared pooled session
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+            futures = {
+                executor.submit(self.session.get, test_url, timeout=10): test_url
+                for test_url in test_urls
+            }
+            
+            for future in as_completed(futures):
+                test_url = futures[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    logger.debug("✗ %s: %s", test_url, e)
+                    continue
+                
                 if response.status_code == 200:
-                    working_endpoints.append({
+                    found[test_url] = {
                         'url': test_url,
                         'status_code': response.status_code,
-                        'content_length': len(response.content),
-                        'content_preview': response.text[:300] if response.text else "Empty response"
-                    })
-                    logger.info(f"✓ Found working endpoint: {test_url}")
+                        'content_length': _content_length(response),
+                        'content_preview': _preview(response, 300)
+                    }
+                    logger.info("✓ Found working endpoint: %s", test_url)
                 else:
-                    logger.debug(f"✗ {test_url}: {response.status_code}")
-            except Exception as e:
-                logger.debug(f"✗ {test_url}: {e}")
+                    logger.debug("✗ %s: %s", test_url, response.status_code)
+        
+        # Report in probe order rather than completion order
+        working_endpoints = [found[url] for url in futures.values() if url in found]
         
         return working_endpoints
     
-    def scrape_with_error_handling(self, urls: List[str]) -> Dict[str, Any]:
-        """Scrape URLs with comprehensive error handling"""
-        results = {
-            'successful_scrapes': [],
-            'failed_scrapes': [],
-            'error_summary': {},
-            'recommendations': []
-        }
+    async def _fetch(self, index: int, total: int, url: str, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        """Fetch a single URL off the event loop and return its result record"""
+        # Try HTTPS first
+        https_url = url.replace('http://', 'https://')
         
-        for i, url in enumerate(urls, 1):
-            logger.info(f"Scraping {i}/{len(urls)}: {url}")
-            
+        async with semaphore:
+            logger.info("Scraping %s/%s: %s", index, total, url)
             try:
-                # Try HTTPS first
-                https_url = url.replace('http://', 'https://')
-                response = self.session.get(https_url, timeout=15)
-                
-                if response.status_code == 200:
-                    results['successful_scrapes'].append({
-                        'url': https_url,
-                        'status_code': response.status_code,
-                        'content_length': len(response.content),
-                        'content_preview': response.text[:500] if response.text else "Empty response"
-                    })
-                    logger.info(f"✓ Success: {https_url}")
-                else:
-                    results['failed_scrapes'].append({
-                        'url': https_url,
-                        'status_code': response.status_code,
-                        'error': f"HTTP {response.status_code}"
-                    })
-                    logger.warning(f"✗ Failed: {https_url} - HTTP {response.status_code}")
-                    
-            except requests.exceptions.RequestException as e:
-                results['failed_scrapes'].append({
+                # Check the status with HEAD so failing URLs never send a body
+                response = await asyncio.to_thread(self.session.head, https_url, timeout=15, allow_redirects=True)
+                # Only download content for pages that exist (or servers that reject HEAD)
+                if response.status_code in (200, 405, 501):
+                    response = await asyncio.to_thread(self.session.get, https_url, timeout=15)
+            except Exception as e:
+                logger.error("✗ Error: %s - %s", url, e)
+                return {
                     'url': url,
                     'error': str(e)
-                })
-                logger.error(f"✗ Error: {url} - {e}")
+                }
+        
+        if response.status_code == 200:
+            logger.info("✓ Success: %s", https_url)
+            return {
+                'url': https_url,
+                'status_code': response.status_code,
+                'content_length': _content_length(response),
+                'content_preview': _preview(response, 500)
+            }
+        
+        logger.warning("✗ Failed: %s - HTTP %s", https_url, response.status_code)
+        return {
+            'url': https_url,
+            'status_code': response.status_code,
+            'error': f"HTTP {response.status_code}"
+        }
+    
+    async def _fetch_all(self, urls: List[str]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield result records as fetches finish, bounded by MAX_CONCURRENT_REQUESTS"""
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        tasks = [self._fetch(i, len(urls), url, semaphore) for i, url in enumerate(urls, 1)]
+        for next_record in asyncio.as_completed(tasks):
+            yield await next_record
+    
+    async def _collect(self, urls: List[str], results: Dict[str, Any], status_codes: Counter,
+                       errors: Counter, stream: Optional[BinaryIO]) -> None:
+        """Tally each record as it arrives, writing it to stream or keeping it in results"""
+        async for record in self._fetch_all(urls):
+            if 'error' in record:
+                results['summary']['failed'] += 1
+                status_codes[record.get('status_code', 'Unknown')] += 1
+                errors[record['error']] += 1
+                bucket = 'failed_scrapes'
+            else:
+                results['summary']['successful'] += 1
+                bucket = 'successful_scrapes'
             
-            # Be respectful - add delay between requests
-            time.sleep(1)
+            if stream is not None:
+                stream.write(orjson.dumps(record) + b'\n')
+            else:
+                results[bucket].append(record)
+    
+    def scrape_with_error_handling(self, urls: List[str], stream: Optional[BinaryIO] = None) -> Dict[str, Any]:
+        """Scrape URLs with comprehensive error handling
+        
+        When stream is given, each record is written to it as a JSON line as soon
+        as it completes, and successful_scrapes/failed_scrapes are left out of
+        the results instead of being kept in memory.
+        """
+        results = {
+            'summary': {'successful': 0, 'failed': 0},
+            'error_summary': {},
+            'recommendations': []
+        }
+        if stream is None:
+            results['successful_scrapes'] = []
+            results['failed_scrapes'] = []
+        
+        # Running tallies so the analysis never needs the records themselves
+        status_codes = Counter()
+        errors = Counter()
+        asyncio.run(self._collect(urls, results, status_codes, errors, stream))
         
         # Analyze results and provide recommendations
-        results['error_summary'] = self._analyze_errors(results['failed_scrapes'])
+        results['error_summary'] = self._analyze_errors(status_codes, errors)
         results['recommendations'] = self._generate_recommendations(results)
         
         return results
     
-    def _analyze_errors(self, failed_scrapes: List[Dict]) -> Dict[str, Any]:
-        """Analyze error patterns"""
-        error_counts = {}
-        status_codes = {}
-        
-        for failure in failed_scrapes:
-            error_type = failure.get('error', 'Unknown')
-            status_code = failure.get('status_code', 'Unknown')
-            
-            error_counts[error_type] = error_counts.get(error_type, 0) + 1
-            status_codes[status_code] = status_codes.get(status_code, 0) + 1
-        
+    def _analyze_errors(self, status_codes: Counter, errors: Counter) -> Dict[str, Any]:
+        """Analyze error patterns from running status-code / error tallies"""
         return {
-            'error_types': error_counts,
-            'status_codes': status_codes,
-            'total_failures': len(failed_scrapes)
+            'error_types': dict(errors),
+            'status_codes': dict(status_codes),
+            'total_failures': sum(errors.values())
         }
     
     def _generate_recommendations(self, results: Dict[str, Any]) -> List[str]:
         """Generate recommendations based on scraping results"""
         recommendations = []
         
-        if not results['successful_scrapes']:
+        if not results['summary']['successful']:
             recommendations.append("❌ No successful scrapes - the site may be down or URLs are incorrect")
             recommendations.append("🔍 Try investigating the site structure manually")
             recommendations.append("🌐 Check if the site has moved to a different domain")
@@ -192,7 +336,7 @@ class D2PBuyersGuideScraper:
     
     def explore_site_structure(self, base_domain: str) -> Dict[str, Any]:
         """Explore the site to understand its current structure"""
-        logger.info(f"Exploring site structure for {base_domain}")
+        logger.info("Exploring site structure for %s", base_domain)
         
         # Test base URL variations
         url_tests = self.test_url_variations(f"https://{base_domain}")
@@ -246,33 +390,49 @@ def main():
     site_analysis = scraper.explore_site_structure("www.d2pbuyersguide.com")
     
     print("\n📊 Site Analysis Results:")
-    print(json.dumps(site_analysis, indent=2))
+    print(orjson.dumps(site_analysis, option=_JSON_OPTIONS).decode())
+    
+    output_dir = 'scraping_output'
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Stream per-URL records to disk as they arrive rather than holding them all
+    records_file = os.path.join(output_dir, 'scraping_results.jsonl')
+    try:
+        stream = open(records_file, 'wb')
+    except OSError as e:
+        print(f"\n⚠️  Warning: Could not open {records_file}: {e}")
+        print("   Per-URL results will be kept in memory instead.")
+        stream = None
     
     print("\n🔄 Attempting to scrape original URLs with fixes...")
-    scrape_results = scraper.scrape_with_error_handling(original_urls)
+    try:
+        scrape_results = scraper.scrape_with_error_handling(original_urls, stream=stream)
+    finally:
+        if stream is not None:
+            stream.close()
+    if stream is not None:
+        scrape_results['records_file'] = records_file
+        print(f"\n💾 Per-URL results streamed to {records_file}")
     
     print("\n📈 Scraping Results:")
-    print(f"✅ Successful scrapes: {len(scrape_results['successful_scrapes'])}")
-    print(f"❌ Failed scrapes: {len(scrape_results['failed_scrapes'])}")
+    print(f"✅ Successful scrapes: {scrape_results['summary']['successful']}")
+    print(f"❌ Failed scrapes: {scrape_results['summary']['failed']}")
     
     print("\n🔧 Error Summary:")
-    print(json.dumps(scrape_results['error_summary'], indent=2))
+    print(orjson.dumps(scrape_results['error_summary'], option=_JSON_OPTIONS).decode())
     
     print("\n💡 Recommendations:")
     for rec in scrape_results['recommendations']:
         print(f"  {rec}")
     
     # Save results to file
-    output_dir = 'scraping_output'
-    os.makedirs(output_dir, exist_ok=True)
-    
     output_file = os.path.join(output_dir, 'scraping_results.json')
     try:
-        with open(output_file, 'w') as f:
-            json.dump({
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps({
                 'site_analysis': site_analysis,
                 'scrape_results': scrape_results
-            }, f, indent=2)
+            }, option=_JSON_OPTIONS))
         print(f"\n💾 Results saved to {output_file}")
     except Exception as e:
         print(f"\n⚠️  Warning: Could not save results to file: {e}")
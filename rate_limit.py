@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Request pacing shared by the d2pbuyersguide.com scrapers
+Standard library only, so simple_scraper stays dependency-free
+"""
+
+import threading
+import time
+
+# Upper bound on requests in flight at once; keeps us polite without serializing
+MAX_CONCURRENT_REQUESTS = 8
+
+# Politeness budget shared by every request
+REQUESTS_PER_SECOND = 5
+
+class RateLimiter:
+    """Spaces requests 1/rate seconds apart, sleeping only for whatever remains"""
+    
+    def __init__(self, rate: float):
+        self.min_interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+    
+    def wait(self) -> None:
+        # Reserve the next slot under the lock, then sleep outside it
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._next_slot - now)
+            self._next_slot = max(now, self._next_slot) + self.min_interval
+        if delay:
+            time.sleep(delay)
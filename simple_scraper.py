@@ -4,13 +4,78 @@ Simple Web Scraper for d2pbuyersguide.com using built-in libraries
 Handles 404 errors and provides analysis
 """
 
+import asyncio
+import http.client
 import urllib.request
 import urllib.error
+import socket
 import ssl
 import json
 import time
 import os
-from typing import List, Dict, Any
+from xml.etree import ElementTree
+from functools import lru_cache
+from collections import Counter
+from typing import List, Dict, Any, Tuple
+
+from rate_limit import MAX_CONCURRENT_REQUESTS, REQUESTS_PER_SECOND, RateLimiter
+
+# Common endpoint patterns to test
+_ENDPOINT_PATHS = (
+    '/',
+    '/index.html',
+    '/index.php',
+    '/home',
+    '/main',
+    '/products',
+    '/items',
+    '/guide',
+    '/buyers-guide',
+    '/d2p',
+    '/api',
+    '/search',
+    '/category',
+    '/filter',
+    '/all',
+    '/page/1',
+    '/page1',
+    '/p/1'
+)
+
+@lru_cache(maxsize=None)
+def _resolve(host: str, port: int) -> Tuple[str, ...]:
+    """Resolve a host once per run - every probe targets the same domain"""
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return tuple(dict.fromkeys(info[4][0] for info in infos))
+
+def _create_connection(address, *args, **kwargs):
+    """socket.create_connection using the cached addresses for the host"""
+    host, port = address
+    error = None
+    for ip in _resolve(host, port):
+        try:
+            return socket.create_connection((ip, port), *args, **kwargs)
+        except OSError as e:
+            error = e
+    raise error
+
+class _CachedDNSHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _create_connection
+
+class _CachedDNSHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _create_connection
+
+class _CachedDNSHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_CachedDNSHTTPConnection, req)
+
+class _CachedDNSHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_CachedDNSHTTPSConnection, req, context=self._context)
 
 class SimpleD2PScraper:
     def __init__(self):
@@ -19,33 +84,61 @@ class SimpleD2PScraper:
         self.ssl_context.check_hostname = False
         self.ssl_context.verify_mode = ssl.CERT_NONE
         
-        # Create opener with custom headers
-        opener = urllib.request.build_opener(urllib.request.HTTPSHandler(context=self.ssl_context))
+        # Create opener with custom headers; urllib opens a fresh connection per
+        # request, so resolve the host once instead of on every probe
+        opener = urllib.request.build_opener(
+            _CachedDNSHTTPHandler(),
+            _CachedDNSHTTPSHandler(context=self.ssl_context)
+        )
         opener.addheaders = [
             ('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
         ]
         urllib.request.install_opener(opener)
+        
+        self.rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
+    
+    def _urlopen(self, request, timeout: float = 15):
+        """urlopen that waits for the rate limiter, so every request is paced"""
+        self.rate_limiter.wait()
+        return urllib.request.urlopen(request, timeout=timeout)
     
     def test_url(self, url: str) -> Dict[str, Any]:
         """Test a single URL and return results"""
         try:
-            with urllib.request.urlopen(url, timeout=15) as response:
-                content = response.read().decode('utf-8', errors='ignore')
+            # Check the status with HEAD so failing URLs never send a body
+            try:
+                self._urlopen(urllib.request.Request(url, method='HEAD')).close()
+            except urllib.error.HTTPError as e:
+                # Some servers reject HEAD outright; let the GET decide
+                if e.code not in (405, 501):
+                    raise
+            
+            with self._urlopen(url) as response:
+                # Only the head of the body is decoded; the rest is read just to
+                # measure it, and only when the server didn't send Content-Length
+                head = response.read(4096)
+                try:
+                    content_length = int(response.headers['Content-Length'])
+                except (KeyError, TypeError, ValueError):
+                    content_length = len(head) + len(response.read())
+                preview = head.decode('utf-8', errors='ignore')[:300]
                 return {
                     'url': url,
                     'status_code': response.getcode(),
                     'success': True,
-                    'content_length': len(content),
-                    'content_preview': content[:300] if content else "Empty response",
+                    'content_length': content_length,
+                    'content_preview': preview if preview else "Empty response",
                     'headers': dict(response.headers)
                 }
         except urllib.error.HTTPError as e:
+            # Failures usually come from the HEAD, which has no body to preview
+            preview = e.read(1024).decode('utf-8', errors='ignore')[:200] if hasattr(e, 'read') else ""
             return {
                 'url': url,
                 'status_code': e.code,
                 'success': False,
                 'error': f"HTTP {e.code}: {e.reason}",
-                'content_preview': e.read().decode('utf-8', errors='ignore')[:200] if hasattr(e, 'read') else "No content"
+                'content_preview': preview if preview else "No content"
             }
         except Exception as e:
             return {
@@ -60,31 +153,12 @@ class SimpleD2PScraper:
         print(f"🔍 Exploring {base_domain}...")
         
         # Test different URL patterns
-        test_urls = [
-            f"https://{base_domain}",
-            f"http://{base_domain}",
-            f"https://{base_domain}/",
-            f"https://{base_domain}/index.html",
-            f"https://{base_domain}/index.php",
-            f"https://{base_domain}/home",
-            f"https://{base_domain}/main",
-            f"https://{base_domain}/products",
-            f"https://{base_domain}/items",
-            f"https://{base_domain}/guide",
-            f"https://{base_domain}/buyers-guide",
-            f"https://{base_domain}/d2p",
-            f"https://{base_domain}/api",
-            f"https://{base_domain}/search",
-            f"https://{base_domain}/category",
-            f"https://{base_domain}/filter",
-            f"https://{base_domain}/all",
-            f"https://{base_domain}/page/1",
-            f"https://{base_domain}/page1",
-            f"https://{base_domain}/p/1"
-        ]
+        test_urls = [f"https://{base_domain}", f"http://{base_domain}"]
+        test_urls += [f"https://{base_domain}{path}" for path in _ENDPOINT_PATHS]
         
         results = []
         working_endpoints = []
+        sitemap_urls = []
         
         for url in test_urls:
             print(f"  Testing: {url}")
@@ -94,15 +168,21 @@ class SimpleD2PScraper:
             if result.get('success') and result.get('status_code') == 200:
                 working_endpoints.append(result)
                 print(f"    ✅ SUCCESS: {result['status_code']} - {result['content_length']} bytes")
+                
+                # The site is up; a sitemap makes the remaining blind probes redundant
+                if len(working_endpoints) == 1:
+                    sitemap_urls = self.find_sitemap_urls(base_domain)
+                    if sitemap_urls:
+                        print(f"    🗺️  Sitemap found with {len(sitemap_urls)} URLs - skipping remaining probes")
+                        break
             else:
                 status = result.get('status_code', 'Error')
                 print(f"    ❌ FAILED: {status}")
-            
-            time.sleep(0.5)  # Be respectful
         
         return {
             'all_tests': results,
             'working_endpoints': working_endpoints,
+            'sitemap_urls': sitemap_urls,
             'summary': {
                 'total_tested': len(results),
                 'successful': len(working_endpoints),
@@ -110,34 +190,58 @@ class SimpleD2PScraper:
             }
         }
     
+    def find_sitemap_urls(self, base_domain: str) -> List[str]:
+        """Return the page URLs listed in the site's sitemap.xml, if it has one"""
+        sitemap_url = f"https://{base_domain}/sitemap.xml"
+        try:
+            # Cheap existence check before downloading the sitemap itself
+            self._urlopen(urllib.request.Request(sitemap_url, method='HEAD')).close()
+            with self._urlopen(sitemap_url) as response:
+                root = ElementTree.fromstring(response.read())
+        except (OSError, ElementTree.ParseError):
+            return []
+        
+        return [loc.text.strip() for loc in root.iter() if loc.tag.endswith('loc') and loc.text]
+    
+    async def _test_original_url(self, index: int, total: int, url: str, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        """Test one original URL in a worker thread and report its outcome"""
+        # Try both HTTP and HTTPS versions
+        https_url = url.replace('http://', 'https://')
+        
+        # Test HTTPS first
+        async with semaphore:
+            result = await asyncio.to_thread(self.test_url, https_url)
+        result['original_url'] = url
+        
+        print(f"  [{index:2d}/{total}] Testing: {url}")
+        if result.get('success') and result.get('status_code') == 200:
+            print(f"    ✅ SUCCESS: {result['status_code']} - {result['content_length']} bytes")
+        else:
+            status = result.get('status_code', 'Error')
+            print(f"    ❌ FAILED: {status}")
+        
+        return result
+    
+    async def _test_original_urls(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """Test all original URLs concurrently, bounded by MAX_CONCURRENT_REQUESTS"""
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        return await asyncio.gather(
+            *(self._test_original_url(i, len(urls), url, semaphore) for i, url in enumerate(urls, 1))
+        )
+    
     def scrape_original_urls(self, urls: List[str]) -> Dict[str, Any]:
         """Scrape the original URLs that failed"""
         print(f"\n🔄 Testing original URLs ({len(urls)} total)...")
         
-        results = []
+        results = asyncio.run(self._test_original_urls(urls))
         successful = []
         failed = []
         
-        for i, url in enumerate(urls, 1):
-            print(f"  [{i:2d}/{len(urls)}] Testing: {url}")
-            
-            # Try both HTTP and HTTPS versions
-            https_url = url.replace('http://', 'https://')
-            
-            # Test HTTPS first
-            result = self.test_url(https_url)
-            result['original_url'] = url
-            results.append(result)
-            
+        for result in results:
             if result.get('success') and result.get('status_code') == 200:
                 successful.append(result)
-                print(f"    ✅ SUCCESS: {result['status_code']} - {result['content_length']} bytes")
             else:
                 failed.append(result)
-                status = result.get('status_code', 'Error')
-                print(f"    ❌ FAILED: {status}")
-            
-            time.sleep(0.5)  # Be respectful
         
         return {
             'all_results': results,
@@ -153,19 +257,9 @@ class SimpleD2PScraper:
     
     def analyze_errors(self, failed_results: List[Dict]) -> Dict[str, Any]:
         """Analyze error patterns"""
-        error_counts = {}
-        status_codes = {}
-        
-        for result in failed_results:
-            error = result.get('error', 'Unknown')
-            status = result.get('status_code', 'Unknown')
-            
-            error_counts[error] = error_counts.get(error, 0) + 1
-            status_codes[status] = status_codes.get(status, 0) + 1
-        
         return {
-            'error_types': error_counts,
-            'status_codes': status_codes,
+            'error_types': dict(Counter(result.get('error', 'Unknown') for result in failed_results)),
+            'status_codes': dict(Counter(result.get('status_code', 'Unknown') for result in failed_results)),
             'total_failures': len(failed_results)
         }
     
@@ -249,6 +343,11 @@ def main():
             print(f"  • {endpoint['url']} ({endpoint['status_code']}) - {endpoint['content_length']} bytes")
             print(f"    Preview: {endpoint['content_preview'][:100]}...")
     
+    if exploration_results['sitemap_urls']:
+        print(f"\n🗺️  Sitemap URLs ({len(exploration_results['sitemap_urls'])} total):")
+        for sitemap_url in exploration_results['sitemap_urls'][:10]:
+            print(f"  • {sitemap_url}")
+    
     # Step 2: Test original URLs
     scraping_results = scraper.scrape_original_urls(original_urls)
     